@@ -6,15 +6,14 @@ from datetime import datetime
 
 from scrape import (
     scrape_website,
-    extract_body_content,
+    extract_and_clean,
     extract_metadata,
     extract_structured_data,
     extract_article_content,
-    clean_body_content,
     split_dom_content,
     scrape_multiple_urls,
 )
-from parse import parse_with_gemini, summarize_with_gemini
+from parse import iter_parse_with_gemini, summarize_with_gemini
 
 # ── Page config ───────────────────────────────────────────────────────────────
 st.set_page_config(
@@ -564,9 +563,10 @@ with st.sidebar:
 
     force_selenium = st.toggle("Force Selenium (JS sites)", value=False)
     wait_time = st.slider("JS render wait (s)", 1, 10, 3)
+    force_refresh = st.toggle("Force refresh (skip cache)", value=False)
     aggressive_clean = st.toggle("Aggressive cleaning", value=True)
-    chunk_size = st.select_slider(
-        "Chunk size (chars)", options=[3000, 4000, 6000, 8000, 10000], value=6000
+    chunk_tokens = st.select_slider(
+        "Chunk size (tokens)", options=[4000, 8000, 16000, 24000, 32000], value=24000
     )
 
     st.divider()
@@ -661,15 +661,17 @@ if scrape_btn:
         bar = st.progress(0, text="Connecting...")
         try:
             bar.progress(15, text="Fetching page...")
-            result = scrape_website(url, use_selenium=force_selenium, wait_time=wait_time)
+            result = scrape_website(
+                url, use_selenium=force_selenium, wait_time=wait_time,
+                force_refresh=force_refresh,
+            )
 
             bar.progress(55, text="Extracting content...")
             html = result["html"]
             if not html:
                 raise ValueError("No HTML returned. The site may be blocking scrapers.")
 
-            body      = extract_body_content(html)
-            cleaned   = clean_body_content(body, aggressive=aggressive_clean)
+            cleaned   = extract_and_clean(html, aggressive=aggressive_clean)
             article   = extract_article_content(html)
             metadata  = extract_metadata(html, url)
             structured = extract_structured_data(html)
@@ -679,12 +681,11 @@ if scrape_btn:
 
             st.session_state.update({
                 "html": html,
-                "body": body,
                 "cleaned": cleaned,
                 "article": article,
                 "metadata": metadata,
                 "structured": structured,
-                "chunks": split_dom_content(cleaned, chunk_size),
+                "chunks": split_dom_content(cleaned, max_tokens=chunk_tokens),
                 "result": result,
                 "scraped_url": url,
             })
@@ -959,25 +960,34 @@ if "result" in st.session_state:
                         st.warning("Describe what to extract or select a preset.")
                     else:
                         bar2 = st.progress(0, text="Starting analysis...")
+                        live = st.empty()
                         try:
-                            # Process and update bar incrementally
-                            from parse import _model, EXTRACT_PROMPT
-                            model = _model()
-                            results = []
-                            for i, chunk in enumerate(chunks, 1):
-                                bar2.progress(int(i / len(chunks) * 100),
-                                              text=f"Chunk {i} of {len(chunks)}")
-                                prompt = EXTRACT_PROMPT.format(content=chunk, task=task)
-                                resp = model.generate_content(prompt)
-                                text = resp.text.strip()
-                                if text and text != "NO_MATCH":
-                                    results.append(text)
+                            # Show each chunk's answer as soon as it arrives
+                            results, errors = {}, []
+                            for done, total, index, text, error in iter_parse_with_gemini(chunks, task):
+                                bar2.progress(int(done / total * 100),
+                                              text=f"Chunk {done} of {total}")
+                                if error:
+                                    errors.append(error)
+                                if text:
+                                    results[index] = text
+                                    shown = "\n\n".join(results.values())
+                                    live.markdown(
+                                        f'<div class="result-block">{shown}</div>',
+                                        unsafe_allow_html=True,
+                                    )
                             bar2.empty()
+                            live.empty()
+                            if errors:
+                                st.warning(f"{len(errors)} of {total} chunk(s) failed: {errors[-1]}")
+                            # Save in page order so reruns give the same answer
                             st.session_state.ai_result = (
-                                "\n\n".join(results) if results else "No matching content found."
+                                "\n\n".join(results[i] for i in sorted(results))
+                                if results else "No matching content found."
                             )
                         except Exception as exc:
                             bar2.empty()
+                            live.empty()
                             st.error(str(exc))
 
             if "ai_result" in st.session_state:
@@ -8,9 +8,26 @@ Set env var:   GEMINI_API_KEY=your_key_here
 import os
 import json
 import re
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import diskcache
 import google.generativeai as genai
 
+MODEL_NAME = "gemini-1.5-flash"   # free-tier model
+MAX_CONCURRENCY = 8
+
+# Cut off trailing commentary so no call spends time generating filler,
+# and cap output at the model's maximum so long lists still fit. Greedy
+# decoding also keeps answers stable for the response cache.
+EXTRACT_CONFIG = {
+    "temperature": 0,
+    "max_output_tokens": 8192,
+    "stop_sequences": ["\n\nExplanation", "\n\nNote:", "\n\n---"],
+}
+
 _configured = False
+_model_instance = None
+CACHE = diskcache.Cache(".parse_cache")
 
 def _setup():
     global _configured
@@ -27,8 +44,27 @@ def _setup():
 
 
 def _model():
-    _setup()
-    return genai.GenerativeModel("gemini-1.5-flash")   # free-tier model
+    # Built once per process; neither the model name nor its config
+    # depends on the call, so every request reuses the same instance.
+    global _model_instance
+    if _model_instance is None:
+        _setup()
+        _model_instance = genai.GenerativeModel(MODEL_NAME)
+    return _model_instance
+
+
+def _cache_key(chunk, parse_description):
+    # Prompt and config are part of the key so changing either one
+    # invalidates answers cached under the old settings.
+    config = json.dumps(EXTRACT_CONFIG, sort_keys=True)
+    return hashlib.sha256(
+        f"{MODEL_NAME}|{config}|{EXTRACT_PROMPT}|{parse_description}|{chunk}".encode()
+    ).hexdigest()
+
+
+def _truncated(response):
+    reason = response.candidates[0].finish_reason if response.candidates else None
+    return getattr(reason, "name", reason) == "MAX_TOKENS"
 
 
 EXTRACT_PROMPT = """\
@@ -61,22 +97,96 @@ Return:
 """
 
 
-def parse_with_gemini(dom_chunks, parse_description):
-    """Extract specific data from page chunks using Gemini."""
+def _unique_chunks(dom_chunks, parse_description):
+    # Repeated boilerplate (nav, footer, listing templates) often produces
+    # identical chunks; only send each distinct one.
+    unique, order = {}, []
+    for chunk in dom_chunks:
+        key = _cache_key(chunk, parse_description)
+        order.append(key)
+        unique.setdefault(key, chunk)
+    return unique, order
+
+
+def _iter_responses(unique, parse_description):
+    """Yield (index, key, text, error) per distinct chunk in completion order.
+
+    ``index`` is the chunk's position among the distinct chunks in page order.
+
+    A failed chunk yields ``text=""`` and the exception so the rest of the batch still runs;
+    if every chunk fails, the last error is raised once iteration ends.
+    """
     model = _model()
-    results = []
 
-    for i, chunk in enumerate(dom_chunks, 1):
-        print(f"Processing chunk {i}/{len(dom_chunks)} ...")
+    def one(key, chunk):
+        if key in CACHE:
+            return CACHE[key]
         prompt = EXTRACT_PROMPT.format(content=chunk, task=parse_description)
-        try:
-            response = model.generate_content(prompt)
-            text = response.text.strip()
-            if text and text != "NO_MATCH":
-                results.append(text)
-        except Exception as exc:
-            print(f"  Chunk {i} error: {exc}")
+        response = model.generate_content(prompt, generation_config=EXTRACT_CONFIG)
+        text = response.text.strip()
+        if _truncated(response):
+            # Keep the partial answer visible but never cache it.
+            return f"{text}\n[output truncated]"
+        CACHE[key] = text
+        return text
+
+    failed, last_error = 0, None
+    pool = ThreadPoolExecutor(max_workers=MAX_CONCURRENCY)
+    try:
+        futures = {
+            pool.submit(one, key, chunk): (i, key)
+            for i, (key, chunk) in enumerate(unique.items())
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            i, key = futures[future]
+            try:
+                text, error = future.result(), None
+            except Exception as exc:
+                print(f"  Chunk {i + 1} error: {exc}")
+                text, error = "", exc
+                failed, last_error = failed + 1, exc
+            print(f"Processed chunk {done}/{len(unique)}")
+            yield i, key, text, error
+    finally:
+        # If the consumer stops early (Streamlit rerun or stop), drop queued
+        # calls instead of blocking until every one of them has run.
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    if unique and failed == len(unique):
+        raise last_error
+
+
+def iter_parse_with_gemini(dom_chunks, parse_description):
+    """Stream extraction results as each chunk finishes.
+
+    Yields ``(done, total, index, text, error)`` in completion order rather
+    than page order, so the first answer can be shown after a single call;
+    sort by ``index`` to restore page order. ``text`` is empty when a chunk
+    had no match or failed; ``error`` holds the exception for a failed
+    chunk. Raises if every chunk fails.
+    """
+    unique, _ = _unique_chunks(dom_chunks, parse_description)
+    responses = _iter_responses(unique, parse_description)
+    for done, (index, _, text, error) in enumerate(responses, 1):
+        text = "" if text == "NO_MATCH" else text
+        yield done, len(unique), index, text, error
+
 
+def parse_with_gemini(dom_chunks, parse_description):
+    """Extract specific data from page chunks using Gemini.
+
+    Chunks are sent concurrently (up to MAX_CONCURRENCY in flight) and the
+    results are joined back in chunk order. Duplicate chunks are sent only
+    once, and responses are cached on disk by model, task and chunk, so
+    re-running the same task skips the API call. A failed chunk is skipped
+    unless every chunk fails, in which case the last error is raised.
+    """
+    unique, order = _unique_chunks(dom_chunks, parse_description)
+    resp_by_key = {
+        key: text for _, key, text, _ in _iter_responses(unique, parse_description)
+    }
+
+    results = [t for t in (resp_by_key[k] for k in order) if t and t != "NO_MATCH"]
     return "\n\n".join(results) if results else "No matching content found."
 
 
@@ -1,11 +1,25 @@
-import requests
+import httpx
 from bs4 import BeautifulSoup
 import re
 import time
 import random
 import json
+import hashlib
+import diskcache
 from urllib.parse import urljoin, urlparse
-from datetime import datetime
+from datetime import date, datetime
+
+try:
+    from lxml import etree, html as lxml_html
+    _PARSER = "lxml"
+except ImportError:
+    etree = lxml_html = None
+    _PARSER = "html.parser"
+
+_HIDDEN_RE = re.compile(r"display\s*:\s*none|visibility\s*:\s*hidden")
+_XML_DECL_RE = re.compile(r"^\s*<\?xml[^>]*\?>")
+# Whitespace around a line break, including any blank lines in between.
+_LINE_WS_RE = re.compile(r"\s*\n\s*")
 
 USER_AGENTS = [
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
@@ -15,6 +29,28 @@ USER_AGENTS = [
     "Mozilla/5.0 (Macintosh; Intel Mac OS X 14_3) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.3 Safari/605.1.15",
 ]
 
+# Shared across scrapes so repeat hits on a host reuse pooled keep-alive
+# connections (multiplexed over HTTP/2 where the server supports it)
+# instead of paying a fresh TCP + TLS handshake each time.
+# No explicit transport: passing one makes httpx ignore HTTP(S)_PROXY.
+_HTTPX = httpx.Client(
+    http2=True,
+    follow_redirects=True,
+    limits=httpx.Limits(max_keepalive_connections=10, max_connections=20),
+)
+
+_SCRAPE_CACHE = diskcache.Cache(".scrape_cache")
+SCRAPE_CACHE_TTL = 86400
+
+
+# Resources the Selenium path never needs for text extraction.
+BLOCKED_RESOURCES = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.css",
+    "*.mp4", "*.webm",
+]
+
+
 def _headers():
     return {
         "User-Agent": random.choice(USER_AGENTS),
@@ -22,7 +58,6 @@ def _headers():
         "Accept-Language": "en-US,en;q=0.9",
         "Accept-Encoding": "gzip, deflate, br",
         "DNT": "1",
-        "Connection": "keep-alive",
         "Upgrade-Insecure-Requests": "1",
         "Cache-Control": "max-age=0",
     }
@@ -40,12 +75,55 @@ def _is_js_heavy(html):
     return any(re.search(p, html) for p in signals)
 
 
+def _read_streamed(resp, block_size=32768):
+    """Read a streamed response, parsing it as the bytes arrive.
+
+    Returns the decoded HTML and the length of its visible text (script and
+    style contents excluded), so the JS-page check needs no second parse.
+    """
+    # Only force an encoding the server declared; otherwise let lxml pick it
+    # up from the BOM or <meta charset>.
+    declared = resp.charset_encoding
+    blocks = []
+    parser = etree.HTMLPullParser(
+        events=("end",), tag=("script", "style"), encoding=declared
+    )
+    for block in resp.iter_bytes(block_size):
+        blocks.append(block)
+        parser.feed(block)
+        for _, el in parser.read_events():
+            el.clear(keep_tail=True)
+    try:
+        root = parser.close()
+    except etree.LxmlError:
+        root = None
+    if root is None:
+        # Empty, whitespace-only or comment-only body.
+        detected, visible = None, 0
+    else:
+        detected = root.getroottree().docinfo.encoding
+        visible = sum(len(t.strip()) for t in root.itertext())
+
+    raw = b"".join(blocks)
+    if declared:
+        html = raw.decode(declared, errors="replace")
+    else:
+        # lxml reports ISO-8859-1 when a page declares nothing, so prefer
+        # UTF-8 whenever the bytes are valid UTF-8.
+        try:
+            html = raw.decode("utf-8")
+        except UnicodeDecodeError:
+            html = raw.decode(detected or "iso-8859-1", errors="replace")
+    return html, visible
+
+
 def _scrape_with_selenium(url, wait_time=3):
     try:
         from selenium import webdriver
         from selenium.webdriver.chrome.options import Options
         from selenium.webdriver.support.ui import WebDriverWait
         from selenium.webdriver.common.by import By
+        from selenium.common.exceptions import TimeoutException
 
         opts = Options()
         opts.add_argument("--headless=new")
@@ -56,13 +134,28 @@ def _scrape_with_selenium(url, wait_time=3):
         opts.add_argument(f"user-agent={random.choice(USER_AGENTS)}")
         opts.add_experimental_option("excludeSwitches", ["enable-automation"])
         opts.add_experimental_option("useAutomationExtension", False)
+        # Return from driver.get on DOMContentLoaded; the body-text wait
+        # below covers content that renders after that.
+        opts.page_load_strategy = "eager"
+        # Text only: skip images outright; JS stays on so SPAs still render.
+        opts.add_experimental_option(
+            "prefs", {"profile.managed_default_content_settings.images": 2}
+        )
 
         driver = webdriver.Chrome(options=opts)
+        driver.set_page_load_timeout(30)
         driver.execute_script(
             "Object.defineProperty(navigator, 'webdriver', {get: () => undefined})"
         )
+        # Must be set before navigation to take effect.
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_RESOURCES})
         try:
-            driver.get(url)
+            try:
+                driver.get(url)
+            except TimeoutException:
+                # Slow page: keep whatever DOM has arrived and carry on.
+                driver.execute_script("window.stop();")
             try:
                 WebDriverWait(driver, 10).until(
                     lambda d: len(d.find_element(By.TAG_NAME, "body").text) > 100
@@ -87,7 +180,23 @@ def _scrape_with_selenium(url, wait_time=3):
         raise RuntimeError(f"Selenium failed: {exc}")
 
 
-def scrape_website(url, use_selenium=False, wait_time=3):
+def scrape_website(url, use_selenium=False, wait_time=3, force_refresh=False):
+    """Fetch a page, reusing today's copy from disk unless force_refresh is set."""
+    key = hashlib.sha256(
+        f"{url}|{use_selenium}|{date.today().isoformat()}".encode()
+    ).hexdigest()
+    if not force_refresh:
+        cached = _SCRAPE_CACHE.get(key)
+        if cached is not None:
+            return {**cached, "method": f"{cached['method']} (cached)"}
+
+    record = _fetch(url, use_selenium, wait_time)
+    if record["html"]:
+        _SCRAPE_CACHE.set(key, record, expire=SCRAPE_CACHE_TTL)
+    return record
+
+
+def _fetch(url, use_selenium, wait_time):
     start = time.time()
     record = {
         "url": url,
@@ -106,30 +215,32 @@ def scrape_website(url, use_selenium=False, wait_time=3):
         return record
 
     try:
-        session = requests.Session()
         # Warm the session
         try:
-            session.head(url, headers=_headers(), timeout=6, allow_redirects=True)
+            _HTTPX.head(url, headers=_headers(), timeout=6)
             time.sleep(random.uniform(0.3, 0.8))
         except Exception:
             pass
 
-        resp = session.get(url, headers=_headers(), timeout=25, allow_redirects=True)
-        record["status_code"] = resp.status_code
-        resp.raise_for_status()
-        html = resp.text
+        with _HTTPX.stream("GET", url, headers=_headers(), timeout=25) as resp:
+            record["status_code"] = resp.status_code
+            resp.raise_for_status()
 
-        soup = BeautifulSoup(html, "html.parser")
-        visible = soup.get_text(strip=True)
+            if etree is not None:
+                html, visible = _read_streamed(resp)
+            else:
+                resp.read()
+                html = resp.text
+                visible = len(BeautifulSoup(html, _PARSER).get_text(strip=True))
 
-        if len(visible) < 300 or _is_js_heavy(html):
+        if visible < 300 or _is_js_heavy(html):
             record["html"] = _scrape_with_selenium(url, wait_time)
             record["method"] = "selenium (JS page)"
         else:
             record["html"] = html
-            record["method"] = "requests"
+            record["method"] = "httpx"
 
-    except requests.exceptions.HTTPError as exc:
+    except httpx.HTTPStatusError as exc:
         record["error"] = f"HTTP {exc.response.status_code}"
         record["html"] = _scrape_with_selenium(url, wait_time)
         record["method"] = "selenium (fallback)"
@@ -144,14 +255,32 @@ def scrape_website(url, use_selenium=False, wait_time=3):
 
 # ---------- Extraction helpers ----------
 
+def _lxml_document(html):
+    """Parse with lxml.html, or return None so callers use BeautifulSoup."""
+    if lxml_html is None:
+        return None
+    try:
+        # lxml refuses str input that carries an XML encoding declaration.
+        return lxml_html.document_fromstring(_XML_DECL_RE.sub("", html, count=1))
+    except (ValueError, etree.ParserError):
+        # Empty or comment-only documents; BeautifulSoup handles them.
+        return None
+
+
 def extract_body_content(html):
-    soup = BeautifulSoup(html, "html.parser")
-    body = soup.body
-    return str(body) if body else str(soup)
+    tree = _lxml_document(html)
+    if tree is None:
+        soup = BeautifulSoup(html, _PARSER)
+        body = soup.body
+        return str(body) if body else str(soup)
+    body = tree.find("body")
+    return lxml_html.tostring(
+        body if body is not None else tree, encoding="unicode"
+    )
 
 
 def extract_metadata(html, url=""):
-    soup = BeautifulSoup(html, "html.parser")
+    soup = BeautifulSoup(html, _PARSER)
     meta = {
         "title": "",
         "description": "",
@@ -230,7 +359,7 @@ def extract_metadata(html, url=""):
 
 
 def extract_structured_data(html):
-    soup = BeautifulSoup(html, "html.parser")
+    soup = BeautifulSoup(html, _PARSER)
     data = {"json_ld": [], "tables": []}
 
     for script in soup.find_all("script", type="application/ld+json"):
@@ -256,7 +385,7 @@ def extract_structured_data(html):
 
 
 def extract_article_content(html):
-    soup = BeautifulSoup(html, "html.parser")
+    soup = BeautifulSoup(html, _PARSER)
     for tag in soup(["script", "style", "nav", "footer", "header", "aside", "form"]):
         tag.decompose()
 
@@ -283,40 +412,95 @@ def extract_article_content(html):
     return soup.get_text(separator="\n", strip=True)
 
 
-def clean_body_content(body_content, aggressive=False):
-    soup = BeautifulSoup(body_content, "html.parser")
+def _clean_text(html, aggressive=False, body_only=False):
     remove = ["script", "style", "noscript", "iframe", "embed", "object"]
     if aggressive:
         remove += ["nav", "footer", "header", "aside", "form",
                    "button", "input", "select", "textarea"]
-    for tag in soup(remove):
-        tag.decompose()
-    for tag in soup.find_all(style=re.compile(r"display\s*:\s*none|visibility\s*:\s*hidden")):
-        tag.decompose()
 
-    text = soup.get_text(separator="\n")
-    lines = [l.strip() for l in text.splitlines() if l.strip()]
-    text = "\n".join(lines)
-    text = re.sub(r'\n{3,}', '\n\n', text)
-    return text.strip()
+    tree = _lxml_document(html)
+    if tree is None:
+        soup = BeautifulSoup(html, _PARSER)
+        root = (soup.body or soup) if body_only else soup
+        for tag in root(remove):
+            tag.decompose()
+        for tag in root.find_all(style=_HIDDEN_RE):
+            tag.decompose()
+        text = "\n".join(root.stripped_strings)
+    else:
+        # Everything below runs inside libxml2; no per-node Python wrappers.
+        root = tree.find("body") if body_only else None
+        if root is None:
+            root = tree
+        for el in list(root.iter(*remove)):
+            el.drop_tree()
+        for el in root.xpath(".//*[@style]"):
+            if _HIDDEN_RE.search(el.get("style")):
+                el.drop_tree()
+        text = "\n".join(t for t in map(str.strip, root.itertext()) if t)
+
+    # Pieces are already stripped; only breaks inside a single text node remain.
+    return _LINE_WS_RE.sub("\n", text)
+
+
+def extract_and_clean(html, aggressive=False):
+    """Cleaned <body> text of a full page, parsing the HTML only once."""
+    return _clean_text(html, aggressive, body_only=True)
+
+
+def clean_body_content(body_content, aggressive=False):
+    return _clean_text(body_content, aggressive)
+
+
+# Gemini's tokenizer averages roughly four characters of English per token.
+CHARS_PER_TOKEN = 4
+
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+_SPACE_RUN_RE = re.compile(r"[ \t]{2,}")
+_PUNCT_RUN_RE = re.compile(r"([^\w\s])\1{3,}")
+# Lone bullet or separator glyphs only; currency, "." and "%" sit on their
+# own lines in split price markup and must survive.
+_BULLET_LINE_RE = re.compile(r"^[•·▪►|*\-–—]$\n?", re.MULTILINE)
+
 
+def _normalize(text):
+    """Squeeze layout noise out of cleaned text so it costs fewer tokens."""
+    text = _BULLET_LINE_RE.sub("", text)
+    text = _PUNCT_RUN_RE.sub(r"\1\1\1", text)
+    text = _SPACE_RUN_RE.sub(" ", text)
+    return _BLANK_LINES_RE.sub("\n\n", text).strip()
 
-def split_dom_content(dom_content, max_length=6000):
+
+def split_dom_content(dom_content, max_length=6000, max_tokens=None):
+    """Split cleaned page text into prompt-sized chunks.
+
+    Expects clean_body_content() output, not raw HTML; markup would waste
+    most of each chunk's token budget.
+    """
+    dom_content = _normalize(dom_content)
+    if max_tokens:
+        max_length = max_tokens * CHARS_PER_TOKEN
     if len(dom_content) <= max_length:
         return [dom_content]
-    chunks, current = [], ""
+    # Collect paragraph parts and join once per chunk rather than growing a
+    # string with +=, and cut oversized paragraphs by offset instead of
+    # re-slicing the remainder on every pass.
+    chunks, parts, size = [], [], 0
     for para in dom_content.split("\n\n"):
-        if len(current) + len(para) + 2 <= max_length:
-            current += ("\n\n" if current else "") + para
-        else:
-            if current:
-                chunks.append(current)
-            while len(para) > max_length:
-                chunks.append(para[:max_length])
-                para = para[max_length:]
-            current = para
-    if current:
-        chunks.append(current)
+        added = len(para) + (2 if parts else 0)
+        if size + added <= max_length:
+            parts.append(para)
+            size += added
+            continue
+        if parts:
+            chunks.append("\n\n".join(parts))
+        start = 0
+        while len(para) - start > max_length:
+            chunks.append(para[start:start + max_length])
+            start += max_length
+        parts, size = [para[start:]], len(para) - start
+    if parts:
+        chunks.append("\n\n".join(parts))
     return chunks
 
 
@@ -325,8 +509,7 @@ def scrape_multiple_urls(urls, delay=1.5):
     for i, url in enumerate(urls):
         try:
             r = scrape_website(url)
-            r["body"] = extract_body_content(r["html"])
-            r["text"] = clean_body_content(r["body"], aggressive=True)
+            r["text"] = extract_and_clean(r["html"], aggressive=True)
             results.append(r)
         except Exception as exc:
             results.append({"url": url, "error": str(exc), "html": ""})